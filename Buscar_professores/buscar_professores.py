@@ -1,7 +1,13 @@
 import os
 import json
+import gzip
+import base64
+import time
+import urllib.parse
+import urllib.request
 import pymysql
 import boto3
+from botocore.config import Config
 from decimal import Decimal
 from aws_lambda_powertools import Logger, Metrics, Tracer
 from aws_lambda_powertools.metrics import MetricUnit
@@ -11,33 +17,149 @@ logger = Logger(service="consulta_professores")
 metrics = Metrics(namespace="AplicacaoEducacional", service="consultas_no_banco")  # ✅ Namespace padronizado
 tracer = Tracer(service="consulta_professores")
 
-# 🔹 Configuração do Secrets Manager
-secrets_client = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"))
+# 🔹 Keep-alive, pool pequeno e retries limitados para os clientes AWS
+BOTO_CONFIG = Config(
+    max_pool_connections=4,
+    retries={"mode": "standard", "max_attempts": 2},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=2,
+)
+
+# 🔹 Cliente do Secrets Manager, criado no primeiro uso
+_SECRETS_CLIENT = None
+
+def _get_secrets_client():
+    """
+    Cria o cliente do Secrets Manager sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SECRETS_CLIENT
+    if _SECRETS_CLIENT is None:
+        _SECRETS_CLIENT = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SECRETS_CLIENT
 
 # 🔹 Variáveis de ambiente
 SECRET_ARN = os.getenv("SECRET_ARN")
 DB_PROXY = os.getenv("DB_PROXY")
 DB_NAME = os.getenv("DB_NAME")
+SECRETS_EXTENSION_PORT = os.getenv("PARAMETERS_SECRETS_EXTENSION_HTTP_PORT", "2773")
+
+def _get_secret_string():
+    """
+    Lê o segredo pela AWS Parameters and Secrets Lambda Extension (cache local da microVM)
+    quando a camada estiver instalada; caso contrário, direto no Secrets Manager.
+    """
+    token = os.getenv("AWS_SESSION_TOKEN")
+    if token:
+        url = (f"http://localhost:{SECRETS_EXTENSION_PORT}/secretsmanager/get"
+               f"?secretId={urllib.parse.quote(SECRET_ARN, safe='')}")
+        request = urllib.request.Request(url, headers={"X-Aws-Parameters-Secrets-Token": token})
+        try:
+            with urllib.request.urlopen(request, timeout=1) as response:
+                return json.loads(response.read())["SecretString"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"Extensão de segredos indisponível, usando o Secrets Manager: {e}")
+
+    response = _get_secrets_client().get_secret_value(SecretId=SECRET_ARN)
+    return response["SecretString"]
+
+# 🔹 Cabeçalhos CORS fixos, montados uma única vez (compartilhados entre respostas; não alterar)
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "OPTIONS, GET",
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Content-Type": "application/json"
+}
+
+# 🔹 Cache das credenciais (sobrevive entre invocações no container quente)
+CREDS_TTL = 900  # segundos
+_CREDS_CACHE = {"value": None, "expires_at": 0.0}
+
+# 🔹 Conexão com o banco reaproveitada entre invocações
+_CONN = None
+
+# 🔹 Decodifica DECIMAL (ex.: valor_hora) direto para float no driver
+DB_CONVERSIONS = pymysql.converters.conversions.copy()
+DB_CONVERSIONS[pymysql.FIELD_TYPE.DECIMAL] = float
+DB_CONVERSIONS[pymysql.FIELD_TYPE.NEWDECIMAL] = float
+
+# 🔹 Consultas pré-montadas (com e sem filtro de matéria)
+# Parte de Materias para filtrar cedo pelos índices de Migracoes/001_indices_busca_professores.sql
+SQL_PROFESSORES = """
+SELECT P.id_professor, P.nome, P.valor_hora, M.nome_materia, M.id_materia
+FROM Materias M
+STRAIGHT_JOIN Conexao_Prof_Materias CPM ON CPM.id_materia = M.id_materia
+STRAIGHT_JOIN Professores P ON P.id_professor = CPM.id_professor
+"""
+SQL_PROFESSORES_POR_MATERIA = SQL_PROFESSORES + "WHERE M.nome_materia = %s"
+
+# 🔹 Linhas lidas por lote do cursor no servidor
+FETCH_BATCH_SIZE = 1024
+
+# 🔹 Respostas menores que isso não compensam a compressão gzip
+GZIP_MIN_BYTES = 1024
+
+# 🔹 Compressão só com GZIP_RESPONSES=1, depois de habilitar binary media types (*/*) na API
+GZIP_RESPONSES = os.getenv("GZIP_RESPONSES", "0") == "1"
+
+# 🔹 Cache dos resultados por matéria (sobrevive entre invocações no container quente)
+CONSULTA_TTL = 60  # segundos
+CONSULTA_CACHE_MAX = 64
+_CONSULTA_CACHE = {}
 
 @tracer.capture_method
 def get_db_credentials():
     """
-    Obtém credenciais do banco via AWS Secrets Manager.
+    Obtém credenciais do banco via AWS Secrets Manager, reaproveitando o cache enquanto válido.
     """
+    if _CREDS_CACHE["value"] is not None and time.time() < _CREDS_CACHE["expires_at"]:
+        return _CREDS_CACHE["value"]
+
     try:
         logger.info(f"Buscando credenciais no Secrets Manager: {SECRET_ARN}")
-        response = secrets_client.get_secret_value(SecretId=SECRET_ARN)
-        secret = json.loads(response["SecretString"])
-        return {
+        secret = json.loads(_get_secret_string())
+        creds = {
             "host": DB_PROXY,
             "user": secret["username"],
             "password": secret["password"],
             "database": DB_NAME,
         }
+        _CREDS_CACHE["value"] = creds
+        _CREDS_CACHE["expires_at"] = time.time() + CREDS_TTL
+        return creds
     except Exception as e:
         logger.error(f"Erro ao buscar credenciais do Secrets Manager: {e}")
         raise
 
+@tracer.capture_method
+def _get_conn(creds):
+    """
+    Retorna a conexão com o RDS Proxy, reaproveitando a do container quente enquanto estiver ativa.
+    """
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping(reconnect=True)
+            return _CONN
+        except pymysql.err.Error as e:
+            logger.warning(f"Conexão reaproveitada indisponível, reconectando: {e}")
+            _CONN = None
+
+    try:
+        _CONN = pymysql.connect(
+            host=creds["host"],
+            user=creds["user"],
+            password=creds["password"],
+            database=creds["database"],
+            connect_timeout=10,
+            autocommit=True,  # Leituras sem transação aberta entre invocações
+            conv=DB_CONVERSIONS
+        )
+    except pymysql.err.OperationalError:
+        _CREDS_CACHE["expires_at"] = 0.0  # Força nova leitura do segredo (ex.: senha rotacionada)
+        raise
+    return _CONN
+
 @tracer.capture_lambda_handler
 @logger.inject_lambda_context
 @metrics.log_metrics
@@ -46,7 +168,8 @@ def lambda_handler(event, context):
     Função Lambda para buscar professores e suas matérias via RDS Proxy.
     """
     try:
-        logger.info("Evento recebido", extra={"event": event})
+        # Evento completo não é serializado no log; nível controlado por POWERTOOLS_LOG_LEVEL
+        logger.debug("Evento recebido", extra={"event_size": len(event.get("body") or "")})
         tracer.put_annotation("Function", "ConsultaProfessores")  # 🔍 Adiciona anotação no X-Ray
 
         # Obtendo parâmetros da query string
@@ -58,85 +181,119 @@ def lambda_handler(event, context):
         # 🔹 Obtém credenciais seguras
         creds = get_db_credentials()
 
-        # 🔹 Consulta professores no banco
-        professores = buscar_professores_no_banco(creds, materia)
-
-        # ✅ Registra métrica personalizada de leitura no banco
-        metrics.add_metric(name="LeituraNoBanco", unit=MetricUnit.Count, value=1)
+        # 🔹 Consulta professores no banco (já serializados em JSON)
+        professores_json = buscar_professores_no_banco(creds, materia)
 
-        return {
+        resposta = {
             "statusCode": 200,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "OPTIONS, GET",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Content-Type": "application/json"
-            },
-            "body": json.dumps(professores)
+            "headers": CORS_HEADERS,
+            "body": professores_json
         }
 
+        # 🔹 Listas grandes voltam comprimidas quando o cliente aceita gzip
+        if GZIP_RESPONSES and _aceita_gzip(event) and len(professores_json) >= GZIP_MIN_BYTES:
+            resposta = _comprimir_resposta(resposta)
+
+        return resposta
+
     except Exception as e:
         logger.exception("Erro inesperado")
         tracer.put_annotation("Error", str(e))  # 🔍 Log de erro no X-Ray
         return {
             "statusCode": 500,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "OPTIONS, GET",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Content-Type": "application/json"
-            },
-            "body": json.dumps({"error": str(e)})
+            "headers": CORS_HEADERS,
+            "body": _dumps({"error": str(e)})
         }
 
 @tracer.capture_method
 def buscar_professores_no_banco(creds, materia):
     """
-    Executa a query no banco para buscar professores e matérias.
+    Executa a query no banco para buscar professores e matérias e retorna a lista em JSON.
+    As linhas são lidas em lotes de um cursor no servidor e serializadas à medida que chegam;
+    o resultado fica em cache por matéria durante CONSULTA_TTL segundos.
     """
-    try:
-        conn = pymysql.connect(
-            host=creds["host"],
-            user=creds["user"],
-            password=creds["password"],
-            database=creds["database"],
-            connect_timeout=10,
-            cursorclass=pymysql.cursors.DictCursor
-        )
+    global _CONN
+    chave = materia  # None (sem filtro) também é uma chave válida
+    agora = time.time()
+    em_cache = _CONSULTA_CACHE.get(chave)
+    if em_cache and em_cache[0] > agora:
+        return em_cache[1]
 
-        with conn.cursor() as cursor:
-            sql = """
-            SELECT P.id_professor, P.nome, P.valor_hora, M.nome_materia, M.id_materia
-            FROM Professores P
-            JOIN Conexao_Prof_Materias CPM ON P.id_professor = CPM.id_professor
-            JOIN Materias M ON CPM.id_materia = M.id_materia
-            WHERE 1=1
-            """
-            values = []
+    try:
+        conn = _get_conn(creds)
 
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
             if materia:
-                sql += " AND M.nome_materia = %s"
-                values.append(materia)
-
-            logger.info(f"🔄 SQL Query: {sql}")
-            logger.info(f"📌 Parâmetros: {values}")
+                sql, values = SQL_PROFESSORES_POR_MATERIA, (materia,)
+            else:
+                sql, values = SQL_PROFESSORES, ()
 
             # Executa a consulta
             cursor.execute(sql, values)
-            professores = cursor.fetchall()
 
-        return convert_decimal_fields(professores)
+            partes = []
+            while True:
+                lote = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not lote:
+                    break
+                partes.append(_dumps(lote)[1:-1])  # Remove os colchetes do lote
 
+        # ✅ Registra métrica personalizada de leitura no banco (apenas quando vai ao banco)
+        metrics.add_metric(name="LeituraNoBanco", unit=MetricUnit.Count, value=1)
+
+        resultado = "[" + ",".join(partes) + "]"
+        if len(_CONSULTA_CACHE) >= CONSULTA_CACHE_MAX:
+            _CONSULTA_CACHE.clear()
+        _CONSULTA_CACHE[chave] = (agora + CONSULTA_TTL, resultado)
+        return resultado
+
+    except pymysql.err.OperationalError as e:
+        logger.error(f"Conexão com o banco perdida: {e}")
+        _CONN = None  # Próxima invocação reconecta
+        raise
     except Exception as e:
         logger.error(f"Erro ao consultar professores: {e}")
         raise
 
-def convert_decimal_fields(rows):
+def _decimal_default(value):
+    """
+    Converte Decimal para float durante a serialização JSON (evita varrer as linhas antes).
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+def _dumps(obj):
     """
-    Converte todos os campos do tipo Decimal para float antes de serializar JSON.
+    Serializa o corpo da resposta em JSON compacto.
+    """
+    return json.dumps(obj, default=_decimal_default, separators=(",", ":"))
+
+def _aceita_gzip(event):
     """
-    for row in rows:
-        for key, value in row.items():
-            if isinstance(value, Decimal):
-                row[key] = float(value)
-    return rows
+    Indica se o cliente enviou Accept-Encoding com gzip.
+    """
+    for nome, valor in (event.get("headers") or {}).items():
+        if nome.lower() == "accept-encoding":
+            return "gzip" in (valor or "")
+    return False
+
+def _comprimir_resposta(resposta):
+    """
+    Comprime o corpo com gzip (nível 1) e o devolve em base64 para a API Gateway.
+    Requer binary media types (*/*) habilitado na API.
+    """
+    corpo_gz = gzip.compress(resposta["body"].encode("utf-8"), compresslevel=1)
+    return {
+        "statusCode": resposta["statusCode"],
+        "isBase64Encoded": True,
+        "headers": {**resposta["headers"], "Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        "body": base64.b64encode(corpo_gz).decode("ascii")
+    }
+
+# 🔹 Pré-aquece segredo e conexão na fase INIT (PREWARM_DB=0 desativa, ex.: testes locais)
+if os.getenv("PREWARM_DB", "1") == "1":
+    try:
+        _get_conn(get_db_credentials())
+    except Exception as e:
+        logger.warning(f"Pré-aquecimento da conexão falhou; será refeito na primeira invocação: {e}")
@@ -1,45 +1,149 @@
 import os
 import json
+import base64
+import time
+import urllib.parse
+import urllib.request
 import pymysql
 import boto3
+from botocore.config import Config
+
+# Keep-alive, pool pequeno e retries limitados para os clientes AWS
+BOTO_CONFIG = Config(
+    max_pool_connections=4,
+    retries={"mode": "standard", "max_attempts": 2},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=2,
+)
+
+# Cliente do Secrets Manager, criado no primeiro uso
+_SECRETS_CLIENT = None
+
+def _get_secrets_client():
+    """
+    Cria o cliente do Secrets Manager sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SECRETS_CLIENT
+    if _SECRETS_CLIENT is None:
+        _SECRETS_CLIENT = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SECRETS_CLIENT
 
-# Configuração do Secrets Manager
-secrets_client = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"))
 SECRET_ARN = os.getenv("SECRET_ARN")
 proxy = os.getenv("DB_PROXY")
 dbname = os.getenv("DB_NAME")
+SECRETS_EXTENSION_PORT = os.getenv("PARAMETERS_SECRETS_EXTENSION_HTTP_PORT", "2773")
+
+def _get_secret_string():
+    """
+    Lê o segredo pela AWS Parameters and Secrets Lambda Extension (cache local da microVM)
+    quando a camada estiver instalada; caso contrário, direto no Secrets Manager.
+    """
+    token = os.getenv("AWS_SESSION_TOKEN")
+    if token:
+        url = (f"http://localhost:{SECRETS_EXTENSION_PORT}/secretsmanager/get"
+               f"?secretId={urllib.parse.quote(SECRET_ARN, safe='')}")
+        request = urllib.request.Request(url, headers={"X-Aws-Parameters-Secrets-Token": token})
+        try:
+            with urllib.request.urlopen(request, timeout=1) as response:
+                return json.loads(response.read())["SecretString"]
+        except (OSError, ValueError, KeyError):
+            pass  # Extensão não instalada: segue para o Secrets Manager
+
+    response = _get_secrets_client().get_secret_value(SecretId=SECRET_ARN)
+    return response["SecretString"]
+
+# Cache das credenciais (sobrevive entre invocações no container quente)
+CREDS_TTL = 900  # segundos
+_CREDS_CACHE = {"value": None, "expires_at": 0.0}
+
+# Conexão com o banco reaproveitada entre invocações
+_CONN = None
+
+# Evento e corpo completos só são impressos com LOG_LEVEL=DEBUG
+LOG_DEBUG = os.getenv("LOG_LEVEL", "INFO").upper() == "DEBUG"
 
 def get_db_credentials():
     """
-    Busca as credenciais do banco de dados no AWS Secrets Manager.
+    Busca as credenciais do banco de dados no AWS Secrets Manager, reaproveitando o cache enquanto válido.
     """
+    if _CREDS_CACHE["value"] is not None and time.time() < _CREDS_CACHE["expires_at"]:
+        return _CREDS_CACHE["value"]
+
     try:
         print(f"🔍 Buscando credenciais no Secrets Manager ({SECRET_ARN})...")
-        response = secrets_client.get_secret_value(SecretId=SECRET_ARN)
-        secret = json.loads(response["SecretString"])
+        secret = json.loads(_get_secret_string())
 
-        return {
+        creds = {
             "host": proxy,  # Usar o endpoint do RDS Proxy
             "user": secret["username"],
             "password": secret["password"],
             "database": dbname,
         }
+        _CREDS_CACHE["value"] = creds
+        _CREDS_CACHE["expires_at"] = time.time() + CREDS_TTL
+        return creds
     except Exception as e:
         print(f"❌ Erro ao buscar credenciais do Secrets Manager: {e}")
         return None
 
+def _get_conn(creds):
+    """
+    Retorna a conexão com o RDS Proxy, reaproveitando a do container quente enquanto estiver ativa.
+    """
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping(reconnect=True)
+            return _CONN
+        except pymysql.err.Error as e:
+            print(f"⚠️ Conexão reaproveitada indisponível, reconectando: {e}")
+            _CONN = None
+
+    try:
+        _CONN = pymysql.connect(
+            host=creds["host"],
+            user=creds["user"],
+            password=creds["password"],
+            database=creds["database"],
+            connect_timeout=10,
+            autocommit=True  # INSERT de comando único: sem COMMIT extra e sem fixar sessão no RDS Proxy
+        )
+    except pymysql.err.OperationalError:
+        _CREDS_CACHE["expires_at"] = 0.0  # Força nova leitura do segredo (ex.: senha rotacionada)
+        raise
+    return _CONN
+
+def _parse_body(raw_body, is_base64=False):
+    """
+    Decodifica o corpo da requisição; retorna None se não for um objeto JSON válido.
+    Com binary media types (*/*) na API, a API Gateway entrega o corpo em base64 (isBase64Encoded).
+    """
+    try:
+        if is_base64:
+            raw_body = base64.b64decode(raw_body)
+        body = json.loads(raw_body) if isinstance(raw_body, (str, bytes)) else raw_body
+    except (TypeError, ValueError):
+        return None
+    return body if isinstance(body, dict) else None
+
 def lambda_handler(event, context):
     """Recebe um JSON com nome e CPF e cadastra um novo aluno no banco via RDS Proxy."""
+    global _CONN
     try:
-        print(f"📌 Evento recebido: {event}")
+        if LOG_DEBUG:
+            print(f"📌 Evento recebido: {event}")
 
         # Verifica se o corpo da requisição está presente
         if "body" not in event:
             return {"statusCode": 400, "body": json.dumps({"error": "Requisição inválida, 'body' ausente"})}
 
         # Converte a string JSON para um dicionário Python
-        body = json.loads(event["body"]) if isinstance(event["body"], str) else event["body"]
-        print(f"📌 JSON Decodificado: {body}")
+        body = _parse_body(event["body"], event.get("isBase64Encoded"))
+        if body is None:
+            return {"statusCode": 400, "body": json.dumps({"error": "Corpo da requisição deve ser um objeto JSON válido"})}
+        if LOG_DEBUG:
+            print(f"📌 JSON Decodificado: {body}")
 
         # Verifica se os campos obrigatórios existem
         if "nome" not in body or "cpf" not in body:
@@ -47,6 +151,8 @@ def lambda_handler(event, context):
 
         nome = body["nome"]
         cpf = body["cpf"]
+        if not isinstance(nome, str) or not nome.strip() or not isinstance(cpf, str) or not cpf.strip():
+            return {"statusCode": 400, "body": json.dumps({"error": "Campos 'nome' e 'cpf' devem ser textos não vazios"})}
         print(f"✅ Dados extraídos: Nome={nome}, CPF={cpf}")
 
         # Obtém credenciais seguras
@@ -54,24 +160,30 @@ def lambda_handler(event, context):
         if not creds:
             return {"statusCode": 500, "body": json.dumps({"error": "Falha ao obter credenciais do banco"})}
 
-        # Conectando ao RDS Proxy via pymysql
-        conn = pymysql.connect(
-            host=creds["host"],
-            user=creds["user"],
-            password=creds["password"],
-            database=creds["database"],
-            connect_timeout=10
-        )
+        # Reaproveita a conexão com o RDS Proxy
+        conn = _get_conn(creds)
 
         with conn.cursor() as cursor:
             # Query SQL para inserir um novo aluno
             sql = "INSERT INTO Alunos (nome, cpf) VALUES (%s, %s)"
             cursor.execute(sql, (nome, cpf))
-            conn.commit()
 
         print("✅ Aluno cadastrado com sucesso")
         return {"statusCode": 201, "body": json.dumps({"message": "Aluno cadastrado com sucesso"})}
 
+    except pymysql.err.OperationalError as e:
+        print(f"❌ Conexão com o banco perdida: {e}")
+        _CONN = None  # Próxima invocação reconecta
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
     except Exception as e:
         print(f"❌ Erro inesperado: {e}")
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+
+# Pré-aquece segredo e conexão na fase INIT (PREWARM_DB=0 desativa, ex.: testes locais)
+if os.getenv("PREWARM_DB", "1") == "1":
+    try:
+        _creds_init = get_db_credentials()
+        if _creds_init:
+            _get_conn(_creds_init)
+    except Exception as e:
+        print(f"⚠️ Pré-aquecimento da conexão falhou; será refeito na primeira invocação: {e}")
@@ -1,7 +1,13 @@
 import os
 import json
+import base64
+import time
+import math
+import urllib.parse
+import urllib.request
 import pymysql
 import boto3
+from botocore.config import Config
 from aws_lambda_powertools import Logger, Metrics, Tracer
 from aws_lambda_powertools.metrics import MetricUnit
 
@@ -10,33 +16,119 @@ logger = Logger(service="criar_conexao")
 metrics = Metrics(namespace="AplicacaoEducacional", service="criar_conexao")
 tracer = Tracer(service="criar_conexao")
 
-# 🔹 Configuração do Secrets Manager
-secrets_client = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"))
+# 🔹 Keep-alive, pool pequeno e retries limitados para os clientes AWS
+BOTO_CONFIG = Config(
+    max_pool_connections=4,
+    retries={"mode": "standard", "max_attempts": 2},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=2,
+)
+
+# 🔹 Cliente do Secrets Manager, criado no primeiro uso
+_SECRETS_CLIENT = None
+
+def _get_secrets_client():
+    """
+    Cria o cliente do Secrets Manager sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SECRETS_CLIENT
+    if _SECRETS_CLIENT is None:
+        _SECRETS_CLIENT = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SECRETS_CLIENT
 
 # 🔹 Variáveis de ambiente
 SECRET_ARN = os.getenv("SECRET_ARN")
 DB_PROXY = os.getenv("DB_PROXY")
 DB_NAME = os.getenv("DB_NAME")
+SECRETS_EXTENSION_PORT = os.getenv("PARAMETERS_SECRETS_EXTENSION_HTTP_PORT", "2773")
+
+def _get_secret_string():
+    """
+    Lê o segredo pela AWS Parameters and Secrets Lambda Extension (cache local da microVM)
+    quando a camada estiver instalada; caso contrário, direto no Secrets Manager.
+    """
+    token = os.getenv("AWS_SESSION_TOKEN")
+    if token:
+        url = (f"http://localhost:{SECRETS_EXTENSION_PORT}/secretsmanager/get"
+               f"?secretId={urllib.parse.quote(SECRET_ARN, safe='')}")
+        request = urllib.request.Request(url, headers={"X-Aws-Parameters-Secrets-Token": token})
+        try:
+            with urllib.request.urlopen(request, timeout=1) as response:
+                return json.loads(response.read())["SecretString"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"Extensão de segredos indisponível, usando o Secrets Manager: {e}")
+
+    response = _get_secrets_client().get_secret_value(SecretId=SECRET_ARN)
+    return response["SecretString"]
+
+# 🔹 Cabeçalhos CORS fixos, montados uma única vez (compartilhados entre respostas; não alterar)
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "OPTIONS, POST, GET",
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Content-Type": "application/json"
+}
+
+# 🔹 Cache das credenciais (sobrevive entre invocações no container quente)
+CREDS_TTL = 900  # segundos
+_CREDS_CACHE = {"value": None, "expires_at": 0.0}
+
+# 🔹 Conexão com o banco reaproveitada entre invocações
+_CONN = None
 
 @tracer.capture_method
 def get_db_credentials():
     """
-    Obtém credenciais do banco via AWS Secrets Manager.
+    Obtém credenciais do banco via AWS Secrets Manager, reaproveitando o cache enquanto válido.
     """
+    if _CREDS_CACHE["value"] is not None and time.time() < _CREDS_CACHE["expires_at"]:
+        return _CREDS_CACHE["value"]
+
     try:
         logger.info(f"Buscando credenciais no Secrets Manager: {SECRET_ARN}")
-        response = secrets_client.get_secret_value(SecretId=SECRET_ARN)
-        secret = json.loads(response["SecretString"])
-        return {
+        secret = json.loads(_get_secret_string())
+        creds = {
             "host": DB_PROXY,
             "user": secret["username"],
             "password": secret["password"],
             "database": DB_NAME,
         }
+        _CREDS_CACHE["value"] = creds
+        _CREDS_CACHE["expires_at"] = time.time() + CREDS_TTL
+        return creds
     except Exception as e:
         logger.error(f"Erro ao buscar credenciais do Secrets Manager: {e}")
         raise
 
+@tracer.capture_method
+def _get_conn(creds):
+    """
+    Retorna a conexão com o RDS Proxy, reaproveitando a do container quente enquanto estiver ativa.
+    """
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping(reconnect=True)
+            return _CONN
+        except pymysql.err.Error as e:
+            logger.warning(f"Conexão reaproveitada indisponível, reconectando: {e}")
+            _CONN = None
+
+    try:
+        _CONN = pymysql.connect(
+            host=creds["host"],
+            user=creds["user"],
+            password=creds["password"],
+            database=creds["database"],
+            connect_timeout=10,
+            autocommit=True  # INSERT de comando único: sem COMMIT extra e sem fixar sessão no RDS Proxy
+        )
+    except pymysql.err.OperationalError:
+        _CREDS_CACHE["expires_at"] = 0.0  # Força nova leitura do segredo (ex.: senha rotacionada)
+        raise
+    return _CONN
+
 @tracer.capture_lambda_handler
 @logger.inject_lambda_context
 @metrics.log_metrics
@@ -45,31 +137,22 @@ def lambda_handler(event, context):
     Função Lambda para criar uma conexão entre aluno e professor via RDS Proxy.
     """
     try:
-        logger.info("Evento recebido", extra={"event": event})
+        # Evento completo não é serializado no log; nível controlado por POWERTOOLS_LOG_LEVEL
+        logger.debug("Evento recebido", extra={"event_size": len(event.get("body") or "")})
         tracer.put_annotation("Function", "CriarConexao")  # 🔍 Adiciona anotação no X-Ray
 
         # 🔹 Tratamento CORS para requisição OPTIONS
         if event.get("httpMethod") == "OPTIONS":
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "OPTIONS, POST, GET",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                },
-                "body": json.dumps({"message": "CORS OK!"})
-            }
+            return cors_response(200, {"message": "CORS OK!"})
 
         # 🔹 Verifica se há um corpo na requisição
         if "body" not in event or not event["body"]:
-            return {
-                "statusCode": 400,
-                "headers": {"Access-Control-Allow-Origin": "*"},
-                "body": json.dumps({"error": "Corpo da requisição está vazio."})
-            }
+            return cors_response(400, {"error": "Corpo da requisição está vazio."})
 
         # 🔹 Decodifica o JSON recebido
-        body = json.loads(event["body"])
+        body = _parse_body(event["body"], event.get("isBase64Encoded"))
+        if body is None:
+            return cors_response(400, {"error": "Corpo da requisição deve ser um objeto JSON válido."})
 
         id_professor = body.get("id_professor")
         id_aluno = body.get("id_aluno")
@@ -78,77 +161,133 @@ def lambda_handler(event, context):
 
         # 🔹 Valida se todos os campos foram fornecidos
         if not all([id_professor, id_aluno, id_materia, horas_contratadas]):
-            return {
-                "statusCode": 400,
-                "headers": {"Access-Control-Allow-Origin": "*"},
-                "body": json.dumps({"error": "Todos os campos são obrigatórios."})
-            }
+            return cors_response(400, {"error": "Todos os campos são obrigatórios."})
+
+        id_professor = _inteiro_positivo(id_professor)
+        id_aluno = _inteiro_positivo(id_aluno)
+        id_materia = _inteiro_positivo(id_materia)
+        if None in (id_professor, id_aluno, id_materia):
+            return cors_response(400, {"error": "Campos 'id_professor', 'id_aluno' e 'id_materia' devem ser inteiros positivos."})
 
-        id_professor = int(id_professor)
-        id_aluno = id_aluno
-        id_materia = int(id_materia)
-        horas_contratadas = int(horas_contratadas)
+        # 🔹 horas_contratadas é DECIMAL: aceita horas fracionadas (ex.: 4.5)
+        horas_contratadas = _numero_positivo(horas_contratadas)
+        if horas_contratadas is None:
+            return cors_response(400, {"error": "Campo 'horas_contratadas' deve ser um número positivo."})
 
         # 🔹 Obtém credenciais seguras
         creds = get_db_credentials()
 
         # 🔹 Cria a conexão no banco
-        conexao_id = criar_conexao_db(creds, id_professor, id_aluno, id_materia, horas_contratadas)
+        conexao_id, criada = criar_conexao_db(creds, id_professor, id_aluno, id_materia, horas_contratadas)
+
+        # 🔹 Repetição da mesma requisição: nada foi inserido nem alterado
+        if not criada:
+            return cors_response(200, {"message": "Conexão já existente.", "id_conexao": conexao_id})
 
         # ✅ Registra métricas no CloudWatch
         metrics.add_metric(name="ConexoesCriadas", unit=MetricUnit.Count, value=1)
         metrics.add_metric(name="InsertsNoBanco", unit=MetricUnit.Count, value=1)  # 📊 Nova métrica para INSERTs no banco
 
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "OPTIONS, POST, GET",
-                "Access-Control-Allow-Headers": "Content-Type",
-            },
-            "body": json.dumps({"message": "Conexão criada com sucesso!", "id_conexao": conexao_id})
-        }
+        return cors_response(200, {"message": "Conexão criada com sucesso!", "id_conexao": conexao_id})
 
     except Exception as e:
         logger.exception("Erro inesperado")
         tracer.put_annotation("Error", str(e))  # 🔍 Log de erro no X-Ray
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "OPTIONS, POST, GET",
-                "Access-Control-Allow-Headers": "Content-Type",
-            },
-            "body": json.dumps({"error": str(e)})
-        }
+        return cors_response(500, {"error": str(e)})
 
 @tracer.capture_method
 def criar_conexao_db(creds, id_professor, id_aluno, id_materia, horas_contratadas):
     """
-    Insere a conexão na tabela Conexoes_Aluno_Prof no RDS Proxy.
+    Insere a conexão na tabela Conexoes_Aluno_Prof no RDS Proxy e retorna (id_conexao, criada).
+    Se o trio aluno/professor/matéria já existir, nada é alterado e o ID existente é retornado,
+    então repetir a requisição é seguro.
     """
+    global _CONN
     try:
-        conn = pymysql.connect(
-            host=creds["host"],
-            user=creds["user"],
-            password=creds["password"],
-            database=creds["database"],
-            connect_timeout=10,
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        conn = _get_conn(creds)
 
         with conn.cursor() as cursor:
             sql = """
             INSERT INTO Conexoes_Aluno_Prof (id_professor, id_aluno, id_materia, horas_contratadas, status)
             VALUES (%s, %s, %s, %s, 'Ativo')
+            ON DUPLICATE KEY UPDATE id_conexao = LAST_INSERT_ID(id_conexao)
             """
             cursor.execute(sql, (id_professor, id_aluno, id_materia, horas_contratadas))
-            conn.commit()
             conexao_id = cursor.lastrowid
+            criada = cursor.rowcount == 1  # 0 quando a linha já existia e não foi alterada
 
-        logger.info(f"✅ Conexão criada com ID: {conexao_id}")
-        return conexao_id
+        if criada:
+            logger.info("✅ Conexão criada", extra={"id_conexao": conexao_id})
+        else:
+            logger.info("Conexão já existente", extra={"id_conexao": conexao_id})
+        return conexao_id, criada
 
+    except pymysql.err.OperationalError as e:
+        logger.error(f"Conexão com o banco perdida: {e}")
+        _CONN = None  # Próxima invocação reconecta
+        raise
     except Exception as e:
         logger.error(f"Erro ao criar conexão: {e}")
         raise
+
+def cors_response(status_code, body):
+    """
+    Gera uma resposta com CORS para a API Gateway.
+    """
+    return {
+        "statusCode": status_code,
+        "headers": CORS_HEADERS,
+        "body": json.dumps(body)
+    }
+
+def _parse_body(raw_body, is_base64=False):
+    """
+    Decodifica o corpo da requisição; retorna None se não for um objeto JSON válido.
+    Com binary media types (*/*) na API, a API Gateway entrega o corpo em base64 (isBase64Encoded).
+    """
+    try:
+        if is_base64:
+            raw_body = base64.b64decode(raw_body)
+        body = json.loads(raw_body) if isinstance(raw_body, (str, bytes)) else raw_body
+    except (TypeError, ValueError):
+        return None
+    return body if isinstance(body, dict) else None
+
+def _inteiro_positivo(valor):
+    """
+    Retorna o valor como int se for um inteiro positivo (número ou texto com dígitos); None caso contrário.
+    Rejeita booleanos e números com parte fracionária em vez de truncá-los.
+    """
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        numero = valor
+    elif isinstance(valor, float) and valor.is_integer():
+        numero = int(valor)
+    elif isinstance(valor, str) and valor.strip().isdecimal():
+        numero = int(valor)
+    else:
+        return None
+    return numero if numero > 0 else None
+
+def _numero_positivo(valor):
+    """
+    Retorna o valor como número se for finito e positivo (número ou texto numérico); None caso contrário.
+    """
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, str):
+        try:
+            valor = float(valor)
+        except ValueError:
+            return None
+    if isinstance(valor, (int, float)) and math.isfinite(valor) and valor > 0:
+        return valor
+    return None
+
+# 🔹 Pré-aquece segredo e conexão na fase INIT (PREWARM_DB=0 desativa, ex.: testes locais)
+if os.getenv("PREWARM_DB", "1") == "1":
+    try:
+        _get_conn(get_db_credentials())
+    except Exception as e:
+        logger.warning(f"Pré-aquecimento da conexão falhou; será refeito na primeira invocação: {e}")
@@ -1,7 +1,13 @@
 import os
 import json
+import base64
+import time
+import math
+import urllib.parse
+import urllib.request
 import pymysql
 import boto3
+from botocore.config import Config
 from aws_lambda_powertools import Logger, Metrics, Tracer
 from aws_lambda_powertools.metrics import MetricUnit
 
@@ -10,35 +16,130 @@ logger = Logger(service="processamento_pagamentos")
 metrics = Metrics(namespace="AplicacaoEducacional", service="consultas_no_banco")  # ✅ Namespace padronizado
 tracer = Tracer(service="processamento_pagamentos")  # 🔍 Habilita o tracing
 
-# 🔒 Configuração do Secrets Manager e SQS
-secrets_client = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"))
-sqs = boto3.client('sqs', region_name=os.getenv("REGION_NAME"))
+# 🔒 Keep-alive, pool pequeno e retries limitados para os clientes AWS
+BOTO_CONFIG = Config(
+    max_pool_connections=4,
+    retries={"mode": "standard", "max_attempts": 2},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=2,
+)
+
+# 🔒 Clientes do Secrets Manager e SQS, criados no primeiro uso
+_SECRETS_CLIENT = None
+_SQS_CLIENT = None
+
+def _get_secrets_client():
+    """
+    Cria o cliente do Secrets Manager sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SECRETS_CLIENT
+    if _SECRETS_CLIENT is None:
+        _SECRETS_CLIENT = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SECRETS_CLIENT
+
+def _get_sqs_client():
+    """
+    Cria o cliente do SQS sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SQS_CLIENT
+    if _SQS_CLIENT is None:
+        _SQS_CLIENT = boto3.client('sqs', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SQS_CLIENT
 
 # 🔧 Variáveis de ambiente da AWS Lambda
 SECRET_ARN = os.getenv("SECRET_ARN")
 DB_PROXY = os.getenv("DB_PROXY")
 DB_NAME = os.getenv("DB_NAME")
+SECRETS_EXTENSION_PORT = os.getenv("PARAMETERS_SECRETS_EXTENSION_HTTP_PORT", "2773")
 SQS_QUEUE_URL = os.getenv("SQS_QUEUE_URL")
 
+def _get_secret_string():
+    """
+    Lê o segredo pela AWS Parameters and Secrets Lambda Extension (cache local da microVM)
+    quando a camada estiver instalada; caso contrário, direto no Secrets Manager.
+    """
+    token = os.getenv("AWS_SESSION_TOKEN")
+    if token:
+        url = (f"http://localhost:{SECRETS_EXTENSION_PORT}/secretsmanager/get"
+               f"?secretId={urllib.parse.quote(SECRET_ARN, safe='')}")
+        request = urllib.request.Request(url, headers={"X-Aws-Parameters-Secrets-Token": token})
+        try:
+            with urllib.request.urlopen(request, timeout=1) as response:
+                return json.loads(response.read())["SecretString"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"Extensão de segredos indisponível, usando o Secrets Manager: {e}")
+
+    response = _get_secrets_client().get_secret_value(SecretId=SECRET_ARN)
+    return response["SecretString"]
+
+# 🔧 Cabeçalhos CORS fixos, montados uma única vez (compartilhados entre respostas; não alterar)
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "OPTIONS, GET, POST",
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Content-Type": "application/json"
+}
+
+# 🔒 Cache das credenciais (sobrevive entre invocações no container quente)
+CREDS_TTL = 900  # segundos
+_CREDS_CACHE = {"value": None, "expires_at": 0.0}
+
+# 🔧 Conexão com o banco reaproveitada entre invocações
+_CONN = None
+
 @tracer.capture_method
 def get_db_credentials():
     """
-    Busca as credenciais do banco de dados no AWS Secrets Manager.
+    Busca as credenciais do banco de dados no AWS Secrets Manager, reaproveitando o cache enquanto válido.
     """
+    if _CREDS_CACHE["value"] is not None and time.time() < _CREDS_CACHE["expires_at"]:
+        return _CREDS_CACHE["value"]
+
     try:
         logger.info(f"Buscando credenciais no Secrets Manager ({SECRET_ARN})...")
-        response = secrets_client.get_secret_value(SecretId=SECRET_ARN)
-        secret = json.loads(response["SecretString"])
-        return {
+        secret = json.loads(_get_secret_string())
+        creds = {
             "host": DB_PROXY,
             "user": secret["username"],
             "password": secret["password"],
             "database": DB_NAME,
         }
+        _CREDS_CACHE["value"] = creds
+        _CREDS_CACHE["expires_at"] = time.time() + CREDS_TTL
+        return creds
     except Exception as e:
         logger.error(f"Erro ao buscar credenciais do Secrets Manager: {e}")
         raise  # Propaga erro para análise no CloudWatch e X-Ray
 
+@tracer.capture_method
+def _get_conn(creds):
+    """
+    Retorna a conexão com o RDS Proxy, reaproveitando a do container quente enquanto estiver ativa.
+    """
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping(reconnect=True)
+            return _CONN
+        except pymysql.err.Error as e:
+            logger.warning(f"Conexão reaproveitada indisponível, reconectando: {e}")
+            _CONN = None
+
+    try:
+        _CONN = pymysql.connect(
+            host=creds["host"],
+            user=creds["user"],
+            password=creds["password"],
+            database=creds["database"],
+            connect_timeout=10,
+            autocommit=True  # INSERT de comando único: sem COMMIT extra e sem fixar sessão no RDS Proxy
+        )
+    except pymysql.err.OperationalError:
+        _CREDS_CACHE["expires_at"] = 0.0  # Força nova leitura do segredo (ex.: senha rotacionada)
+        raise
+    return _CONN
+
 @tracer.capture_lambda_handler  # 🔍 Captura automaticamente a execução da Lambda
 @logger.inject_lambda_context
 @metrics.log_metrics
@@ -47,26 +148,22 @@ def lambda_handler(event, context):
     Função Lambda para registrar um pagamento no banco via RDS Proxy e enviar para SQS.
     """
     try:
-        logger.info("Evento recebido", extra={"event": event})
+        # Evento completo não é serializado no log; nível controlado por POWERTOOLS_LOG_LEVEL
+        logger.debug("Evento recebido", extra={"event_size": len(event.get("body") or "")})
         tracer.put_annotation("Function", "GerarPagamento")  # Adiciona anotações no X-Ray
 
         # ✅ Tratamento de requisição OPTIONS para CORS
         if event.get("httpMethod") == "OPTIONS":
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "OPTIONS, GET, POST",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                },
-                "body": json.dumps({"message": "CORS OK!"})
-            }
+            return cors_response(200, {"message": "CORS OK!"})
 
         # 🔍 Verifica se há um corpo na requisição
         if "body" not in event or not event["body"]:
             return cors_response(400, {"error": "Corpo da requisição está vazio."})
 
-        body = json.loads(event["body"])
+        body = _parse_body(event["body"], event.get("isBase64Encoded"))
+        if body is None:
+            return cors_response(400, {"error": "Corpo da requisição deve ser um objeto JSON válido."})
+
         id_conexao = body.get("id_conexao")
         valor = body.get("valor")
         forma_pagamento = body.get("forma_pagamento")
@@ -74,6 +171,16 @@ def lambda_handler(event, context):
         if not all([id_conexao, valor, forma_pagamento]):
             return cors_response(400, {"error": "Todos os campos são obrigatórios."})
 
+        # 🔍 Valida os tipos antes do INSERT e da mensagem para o SQS
+        id_conexao = _inteiro_positivo(id_conexao)
+        if id_conexao is None:
+            return cors_response(400, {"error": "Campo 'id_conexao' deve ser um inteiro positivo."})
+        valor = _numero_positivo(valor)
+        if valor is None:
+            return cors_response(400, {"error": "Campo 'valor' deve ser um número positivo."})
+        if not isinstance(forma_pagamento, str) or not forma_pagamento.strip():
+            return cors_response(400, {"error": "Campo 'forma_pagamento' deve ser um texto."})
+
         creds = get_db_credentials()
         if not creds:
             return cors_response(500, {"error": "Falha ao obter credenciais do banco"})
@@ -98,27 +205,10 @@ def lambda_handler(event, context):
 def processar_pagamento(creds, id_conexao, valor, forma_pagamento):
     """
     Processa o pagamento e envia mensagem para o SQS.
+    O envio só acontece depois que o INSERT foi confirmado e o banco liberado.
     """
     try:
-        conn = pymysql.connect(
-            host=creds["host"],
-            user=creds["user"],
-            password=creds["password"],
-            database=creds["database"],
-            connect_timeout=10,
-            cursorclass=pymysql.cursors.DictCursor
-        )
-
-        with conn.cursor() as cursor:
-            sql = """
-            INSERT INTO Pagamentos (id_conexao, valor, forma_pagamento, status_pagamento)
-            VALUES (%s, %s, %s, 'Pendente')
-            """
-            cursor.execute(sql, (id_conexao, valor, forma_pagamento))
-            conn.commit()
-            pagamento_id = cursor.lastrowid
-
-        logger.info(f"✅ Pagamento inserido com ID: {pagamento_id}")
+        pagamento_id = inserir_pagamento_db(creds, id_conexao, valor, forma_pagamento)
 
         mensagem_sqs = {
             "id_pagamento": pagamento_id,
@@ -128,9 +218,9 @@ def processar_pagamento(creds, id_conexao, valor, forma_pagamento):
             "status_pagamento": "Pendente"
         }
 
-        logger.info(f"📩 Enviando mensagem para SQS: {mensagem_sqs}")
+        logger.info("📩 Enviando mensagem para SQS", extra={"id_pagamento": pagamento_id})
 
-        sqs.send_message(
+        _get_sqs_client().send_message(
             QueueUrl=SQS_QUEUE_URL,
             MessageBody=json.dumps(mensagem_sqs)
         )
@@ -141,16 +231,89 @@ def processar_pagamento(creds, id_conexao, valor, forma_pagamento):
         logger.error(f"❌ Erro ao processar pagamento: {e}")
         raise
 
+@tracer.capture_method
+def inserir_pagamento_db(creds, id_conexao, valor, forma_pagamento):
+    """
+    Insere o pagamento como 'Pendente' na tabela Pagamentos e retorna o ID gerado.
+    """
+    global _CONN
+    try:
+        conn = _get_conn(creds)
+
+        with conn.cursor() as cursor:
+            sql = """
+            INSERT INTO Pagamentos (id_conexao, valor, forma_pagamento, status_pagamento)
+            VALUES (%s, %s, %s, 'Pendente')
+            """
+            cursor.execute(sql, (id_conexao, valor, forma_pagamento))
+            pagamento_id = cursor.lastrowid
+
+        logger.info("✅ Pagamento inserido", extra={"id_pagamento": pagamento_id})
+        return pagamento_id
+
+    except pymysql.err.OperationalError as e:
+        logger.error(f"❌ Conexão com o banco perdida: {e}")
+        _CONN = None  # Próxima invocação reconecta
+        raise
+
+def _parse_body(raw_body, is_base64=False):
+    """
+    Decodifica o corpo da requisição; retorna None se não for um objeto JSON válido.
+    Com binary media types (*/*) na API, a API Gateway entrega o corpo em base64 (isBase64Encoded).
+    """
+    try:
+        if is_base64:
+            raw_body = base64.b64decode(raw_body)
+        body = json.loads(raw_body) if isinstance(raw_body, (str, bytes)) else raw_body
+    except (TypeError, ValueError):
+        return None
+    return body if isinstance(body, dict) else None
+
+def _inteiro_positivo(valor):
+    """
+    Retorna o valor como int se for um inteiro positivo (número ou texto com dígitos); None caso contrário.
+    Rejeita booleanos e números com parte fracionária em vez de truncá-los.
+    """
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, int):
+        numero = valor
+    elif isinstance(valor, float) and valor.is_integer():
+        numero = int(valor)
+    elif isinstance(valor, str) and valor.strip().isdecimal():
+        numero = int(valor)
+    else:
+        return None
+    return numero if numero > 0 else None
+
+def _numero_positivo(valor):
+    """
+    Retorna o valor como número se for finito e positivo (número ou texto numérico); None caso contrário.
+    """
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, str):
+        try:
+            valor = float(valor)
+        except ValueError:
+            return None
+    if isinstance(valor, (int, float)) and math.isfinite(valor) and valor > 0:
+        return valor
+    return None
+
 def cors_response(status_code, body):
     """
     Gera uma resposta com CORS para a API Gateway.
     """
     return {
         "statusCode": status_code,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "OPTIONS, GET, POST",
-            "Access-Control-Allow-Headers": "Content-Type",
-        },
+        "headers": CORS_HEADERS,
         "body": json.dumps(body)
     }
+
+# 🔧 Pré-aquece segredo e conexão na fase INIT (PREWARM_DB=0 desativa, ex.: testes locais)
+if os.getenv("PREWARM_DB", "1") == "1":
+    try:
+        _get_conn(get_db_credentials())
+    except Exception as e:
+        logger.warning(f"Pré-aquecimento da conexão falhou; será refeito na primeira invocação: {e}")
@@ -1,7 +1,11 @@
 import os
 import json
+import gzip
+import base64
+import time
 import pymysql
 import boto3
+from botocore.config import Config
 from decimal import Decimal
 from aws_lambda_powertools import Logger, Metrics, Tracer
 from aws_lambda_powertools.metrics import MetricUnit
@@ -11,43 +15,162 @@ logger = Logger(service="consultas_aluno")
 metrics = Metrics(namespace="AplicacaoEducacional", service="consultas_no_banco")  # ✅ Namespace padronizado
 tracer = Tracer(service="consultas_no_banco")
 
+# Keep-alive, pool pequeno e retries limitados para os clientes AWS
+BOTO_CONFIG = Config(
+    max_pool_connections=4,
+    retries={"mode": "standard", "max_attempts": 2},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=2,
+)
 
-# Configuração do Secrets Manager e RDS Proxy
-secrets_client = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"))
+# Cliente do Secrets Manager, criado no primeiro uso
+_SECRETS_CLIENT = None
+
+def _get_secrets_client():
+    """
+    Cria o cliente do Secrets Manager sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SECRETS_CLIENT
+    if _SECRETS_CLIENT is None:
+        _SECRETS_CLIENT = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SECRETS_CLIENT
 
 # Variáveis de ambiente da Lambda
 SECRET_ARN = os.getenv("SECRET_ARN")  # Secret Manager do banco
 DB_PROXY = os.getenv("DB_PROXY")  # Endpoint do RDS Proxy
 DB_NAME = os.getenv("DB_NAME")  # Nome do banco
 
+# Cache das credenciais (sobrevive entre invocações no container quente)
+CREDS_TTL = 900  # segundos
+_CREDS_CACHE = {"value": None, "expires_at": 0.0}
+
+# Conexão com o banco reaproveitada entre invocações
+_CONN = None
+
+# Cabeçalhos CORS fixos, montados uma única vez (compartilhados entre respostas; não alterar)
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "OPTIONS, GET",
+    "Access-Control-Allow-Headers": "Content-Type",
+    "Content-Type": "application/json"
+}
+
+# Respostas constantes, com o corpo já serializado
+RESPOSTA_OPTIONS = {
+    "statusCode": 200,
+    "headers": CORS_HEADERS,
+    "body": json.dumps({"message": "CORS OK!"})
+}
+RESPOSTA_ID_ALUNO_AUSENTE = {
+    "statusCode": 400,
+    "headers": CORS_HEADERS,
+    "body": json.dumps({"error": "O parâmetro 'id_aluno' é obrigatório."})
+}
+
+# Decodifica DECIMAL (ex.: horas_contratadas) direto para float no driver
+DB_CONVERSIONS = pymysql.converters.conversions.copy()
+DB_CONVERSIONS[pymysql.FIELD_TYPE.DECIMAL] = float
+DB_CONVERSIONS[pymysql.FIELD_TYPE.NEWDECIMAL] = float
+
+# Linhas lidas por lote do cursor no servidor
+FETCH_BATCH_SIZE = 1024
+
+# Respostas menores que isso não compensam a compressão gzip
+GZIP_MIN_BYTES = 1024
+
+# Compressão só com GZIP_RESPONSES=1, depois de habilitar binary media types (*/*) na API
+GZIP_RESPONSES = os.getenv("GZIP_RESPONSES", "0") == "1"
+
 @tracer.capture_method
 def get_db_credentials():
     """
-    Obtém credenciais do banco via AWS Secrets Manager.
+    Obtém credenciais do banco via AWS Secrets Manager, reaproveitando o cache enquanto válido.
     """
+    if _CREDS_CACHE["value"] is not None and time.time() < _CREDS_CACHE["expires_at"]:
+        return _CREDS_CACHE["value"]
+
     try:
         logger.info(f"Buscando credenciais no Secrets Manager: {SECRET_ARN}")
-        response = secrets_client.get_secret_value(SecretId=SECRET_ARN)
+        response = _get_secrets_client().get_secret_value(SecretId=SECRET_ARN)
         secret = json.loads(response["SecretString"])
-        return {
+        creds = {
             "host": DB_PROXY,
             "user": secret["username"],
             "password": secret["password"],
             "database": DB_NAME,
         }
+        _CREDS_CACHE["value"] = creds
+        _CREDS_CACHE["expires_at"] = time.time() + CREDS_TTL
+        return creds
     except Exception as e:
         logger.error(f"Erro ao buscar credenciais do Secrets Manager: {e}")
         raise
 
-def convert_decimal_fields(rows):
+@tracer.capture_method
+def _get_conn(creds):
     """
-    Converte todos os campos Decimal para float em uma lista de dicionários.
+    Retorna a conexão com o RDS Proxy, reaproveitando a do container quente enquanto estiver ativa.
     """
-    for row in rows:
-        for key, value in row.items():
-            if isinstance(value, Decimal):
-                row[key] = float(value)
-    return rows
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping(reconnect=True)
+            return _CONN
+        except pymysql.err.Error as e:
+            logger.warning(f"Conexão reaproveitada indisponível, reconectando: {e}")
+            _CONN = None
+
+    try:
+        _CONN = pymysql.connect(
+            host=creds["host"],
+            user=creds["user"],
+            password=creds["password"],
+            database=creds["database"],
+            connect_timeout=10,
+            autocommit=True,  # Leituras sem transação aberta entre invocações
+            conv=DB_CONVERSIONS
+        )
+    except pymysql.err.OperationalError:
+        _CREDS_CACHE["expires_at"] = 0.0  # Força nova leitura do segredo (ex.: senha rotacionada)
+        raise
+    return _CONN
+
+def _decimal_default(value):
+    """
+    Converte Decimal para float durante a serialização JSON (evita varrer as linhas antes).
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+def _dumps(obj):
+    """
+    Serializa o corpo da resposta em JSON compacto.
+    """
+    return json.dumps(obj, default=_decimal_default, separators=(",", ":"))
+
+def _aceita_gzip(event):
+    """
+    Indica se o cliente enviou Accept-Encoding com gzip.
+    """
+    for nome, valor in (event.get("headers") or {}).items():
+        if nome.lower() == "accept-encoding":
+            return "gzip" in (valor or "")
+    return False
+
+def _comprimir_resposta(resposta):
+    """
+    Comprime o corpo com gzip (nível 1) e o devolve em base64 para a API Gateway.
+    Requer binary media types (*/*) habilitado na API.
+    """
+    corpo_gz = gzip.compress(resposta["body"].encode("utf-8"), compresslevel=1)
+    return {
+        "statusCode": resposta["statusCode"],
+        "isBase64Encoded": True,
+        "headers": {**resposta["headers"], "Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        "body": base64.b64encode(corpo_gz).decode("ascii")
+    }
 
 @tracer.capture_lambda_handler
 @logger.inject_lambda_context
@@ -57,31 +180,20 @@ def lambda_handler(event, context):
     Função Lambda para buscar todas as conexões de um aluno.
     """
     try:
-        logger.info("Evento recebido", extra={"event": event})
+        # Evento completo não é serializado no log; nível controlado por POWERTOOLS_LOG_LEVEL
+        logger.debug("Evento recebido", extra={"event_size": len(event.get("body") or "")})
         tracer.put_annotation("Function", "GetAlunoConexoes")  # X-Ray annotation
 
         # Tratamento CORS para requisição OPTIONS
         if event.get("httpMethod") == "OPTIONS":
-            return {
-                "statusCode": 200,
-                "headers": {
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "OPTIONS, GET",
-                    "Access-Control-Allow-Headers": "Content-Type",
-                },
-                "body": json.dumps({"message": "CORS OK!"})
-            }
+            return RESPOSTA_OPTIONS
 
         # Obtém parâmetros da query string
         params = event.get("queryStringParameters", {}) or {}
         id_aluno = params.get("id_aluno")
 
         if not id_aluno:
-            return {
-                "statusCode": 400,
-                "headers": {"Access-Control-Allow-Origin": "*"},
-                "body": json.dumps({"error": "O parâmetro 'id_aluno' é obrigatório."})
-            }
+            return RESPOSTA_ID_ALUNO_AUSENTE
 
         logger.info(f"Buscando conexões para o aluno ID: {id_aluno}")
 
@@ -89,49 +201,40 @@ def lambda_handler(event, context):
         creds = get_db_credentials()
 
         # Consulta conexões do aluno
-        conexoes = consultar_conexoes_aluno(creds, id_aluno)
+        conexoes_json = consultar_conexoes_aluno(creds, id_aluno)
 
-        return {
+        resposta = {
             "statusCode": 200,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "OPTIONS, GET",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Content-Type": "application/json"
-            },
-            "body": json.dumps(conexoes)
+            "headers": CORS_HEADERS,
+            "body": conexoes_json
         }
 
+        # Listas grandes voltam comprimidas quando o cliente aceita gzip
+        if GZIP_RESPONSES and _aceita_gzip(event) and len(conexoes_json) >= GZIP_MIN_BYTES:
+            resposta = _comprimir_resposta(resposta)
+
+        return resposta
+
     except Exception as e:
         logger.exception("Erro inesperado")
         tracer.put_annotation("Error", str(e))
         return {
             "statusCode": 500,
-            "headers": {
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "OPTIONS, GET",
-                "Access-Control-Allow-Headers": "Content-Type",
-                "Content-Type": "application/json"
-            },
-            "body": json.dumps({"error": str(e)})
+            "headers": CORS_HEADERS,
+            "body": _dumps({"error": str(e)})
         }
 
 @tracer.capture_method
 def consultar_conexoes_aluno(creds, id_aluno):
     """
-    Executa a consulta SQL para buscar conexões do aluno no banco de dados.
+    Executa a consulta SQL para buscar conexões do aluno no banco de dados e retorna a lista em JSON.
+    As linhas são lidas em lotes de um cursor no servidor e serializadas à medida que chegam.
     """
+    global _CONN
     try:
-        conn = pymysql.connect(
-            host=creds["host"],
-            user=creds["user"],
-            password=creds["password"],
-            database=creds["database"],
-            connect_timeout=10,
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        conn = _get_conn(creds)
 
-        with conn.cursor() as cursor:
+        with conn.cursor(pymysql.cursors.SSDictCursor) as cursor:
             sql = """
             SELECT C.id_conexao, P.nome AS professor, M.nome_materia, C.horas_contratadas, C.status
             FROM Conexoes_Aluno_Prof C
@@ -139,17 +242,35 @@ def consultar_conexoes_aluno(creds, id_aluno):
             JOIN Materias M ON C.id_materia = M.id_materia
             WHERE C.id_aluno = %s
             """
-            logger.info(f"Executando SQL: {sql} com id_aluno={id_aluno}")
             cursor.execute(sql, (id_aluno,))
-            conexoes = cursor.fetchall()
+
+            partes = []
+            total = 0
+            while True:
+                lote = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if not lote:
+                    break
+                total += len(lote)
+                partes.append(_dumps(lote)[1:-1])  # Remove os colchetes do lote
 
             # 🔥 Adiciona métrica de leitura no banco
             metrics.add_metric(name="LeituraNoBanco", unit=MetricUnit.Count, value=1)
 
-        logger.info(f"Conexões encontradas para aluno {id_aluno}: {conexoes}")
+        logger.info(f"Conexões encontradas para aluno {id_aluno}: {total}")
 
-        return convert_decimal_fields(conexoes)
+        return "[" + ",".join(partes) + "]"
 
+    except pymysql.err.OperationalError as e:
+        logger.error(f"Conexão com o banco perdida: {e}")
+        _CONN = None  # Próxima invocação reconecta
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar conexões no banco: {e}")
         raise
+
+# Pré-aquece segredo e conexão na fase INIT (PREWARM_DB=0 desativa, ex.: testes locais)
+if os.getenv("PREWARM_DB", "1") == "1":
+    try:
+        _get_conn(get_db_credentials())
+    except Exception as e:
+        logger.warning(f"Pré-aquecimento da conexão falhou; será refeito na primeira invocação: {e}")
@@ -0,0 +1,6 @@
+-- Índices de cobertura para a busca de professores por matéria (Buscar_professores).
+-- Com eles o filtro por nome_materia vira um lookup (type=ref, Using index) em Materias
+-- e a junção com Conexao_Prof_Materias é resolvida só pelo índice.
+
+CREATE INDEX idx_materias_nome ON Materias (nome_materia, id_materia);
+CREATE INDEX idx_cpm_materia_prof ON Conexao_Prof_Materias (id_materia, id_professor);
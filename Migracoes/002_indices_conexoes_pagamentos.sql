@@ -0,0 +1,9 @@
+-- Índices de apoio às chaves estrangeiras usadas nos INSERTs de Cria_Conexões e Cria_pagamentos.
+-- Sem eles a validação das FKs pode recorrer a gap locks e serializar inserções concorrentes.
+
+CREATE INDEX idx_pag_conexao ON Pagamentos (id_conexao);
+
+-- Um aluno tem no máximo uma conexão por professor e matéria; o INSERT de
+-- criar_conexao_db usa ON DUPLICATE KEY UPDATE sobre este índice.
+-- Remova duplicatas existentes antes de criá-lo.
+CREATE UNIQUE INDEX idx_conx_trip ON Conexoes_Aluno_Prof (id_aluno, id_professor, id_materia);
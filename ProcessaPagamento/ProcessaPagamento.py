@@ -1,8 +1,11 @@
 import os
 import json
+import time
 import random
 import pymysql
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from aws_lambda_powertools import Logger, Metrics, Tracer
 from aws_lambda_powertools.metrics import MetricUnit
 
@@ -11,22 +14,59 @@ logger = Logger(service="processamento_pagamentos")
 metrics = Metrics(namespace="AplicacaoEducacional", service="consultas_no_banco")  # ✅ Namespace padronizado
 tracer = Tracer(service="processamento_pagamentos")
 
-# 🔒 Configuração do Secrets Manager e SQS
-secrets_client = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"))
-sqs = boto3.client('sqs', region_name=os.getenv("REGION_NAME"))
+# 🔧 Keep-alive, pool pequeno e retries limitados para os clientes AWS
+BOTO_CONFIG = Config(
+    max_pool_connections=4,
+    retries={"mode": "standard", "max_attempts": 2},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=2,
+)
+
+# 🔒 Cliente do Secrets Manager, criado no primeiro uso
+_SECRETS_CLIENT = None
+
+def _get_secrets_client():
+    """
+    Cria o cliente do Secrets Manager sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SECRETS_CLIENT
+    if _SECRETS_CLIENT is None:
+        _SECRETS_CLIENT = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SECRETS_CLIENT
 
 # 🔧 Variáveis de ambiente da AWS Lambda
 SECRET_ARN = os.getenv("SECRET_ARN")
 DB_PROXY = os.getenv("DB_PROXY")
 DB_NAME = os.getenv("DB_NAME")
-SQS_QUEUE_URL = os.getenv("SQS_QUEUE_URL")
+
+# 🔧 Cabeçalhos CORS fixos, montados uma única vez (compartilhados entre respostas; não alterar)
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "OPTIONS, GET, POST",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+# 🔧 Cache das credenciais (sobrevive entre invocações no container quente)
+CREDS_TTL = 900  # segundos
+_CREDS_CACHE = {"value": None, "expires_at": 0.0}
+
+# 🔧 Conexão com o banco reaproveitada entre invocações
+_CONN = None
+
+# 🔧 Threads para as chamadas ao gateway de pagamento (um lote do SQS tem até 10 mensagens)
+MAX_WORKERS_PAGAMENTO = 10
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS_PAGAMENTO)
 
 @tracer.capture_method
 def get_db_credentials():
-    """Busca as credenciais do banco de dados no AWS Secrets Manager."""
+    """Busca as credenciais do banco de dados no AWS Secrets Manager, reaproveitando o cache enquanto válido."""
+    if _CREDS_CACHE["value"] is not None and time.time() < _CREDS_CACHE["expires_at"]:
+        return _CREDS_CACHE["value"]
+
     try:
         logger.info(f"🔍 Buscando credenciais no Secrets Manager ({SECRET_ARN})...")
-        response = secrets_client.get_secret_value(SecretId=SECRET_ARN)
+        response = _get_secrets_client().get_secret_value(SecretId=SECRET_ARN)
         secret = json.loads(response["SecretString"])
         creds = {
             "host": DB_PROXY,
@@ -35,34 +75,85 @@ def get_db_credentials():
             "database": DB_NAME,
         }
         logger.info("✅ Credenciais obtidas com sucesso.")
+        _CREDS_CACHE["value"] = creds
+        _CREDS_CACHE["expires_at"] = time.time() + CREDS_TTL
         return creds
     except Exception as e:
         logger.error(f"❌ Erro ao buscar credenciais do Secrets Manager: {e}")
         raise
 
+@tracer.capture_method
+def _get_conn(creds):
+    """
+    Retorna a conexão com o RDS Proxy, reaproveitando a do container quente enquanto estiver ativa.
+    """
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping(reconnect=True)
+            return _CONN
+        except pymysql.err.Error as e:
+            logger.warning(f"Conexão reaproveitada indisponível, reconectando: {e}")
+            _CONN = None
+
+    try:
+        _CONN = pymysql.connect(
+            host=creds["host"],
+            user=creds["user"],
+            password=creds["password"],
+            database=creds["database"],
+            connect_timeout=10,
+            autocommit=True  # Cada UPDATE é sua própria transação
+        )
+    except pymysql.err.OperationalError:
+        _CREDS_CACHE["expires_at"] = 0.0  # Força nova leitura do segredo (ex.: senha rotacionada)
+        raise
+    return _CONN
+
 @tracer.capture_method
 def processar_pagamento(pagamento):
     """Simula a integração com o PayPal e define um status aleatório para o pagamento."""
-    logger.info(f"💳 Simulando integração com PayPal para pagamento: {pagamento}")
+    logger.info("💳 Simulando integração com PayPal", extra={"id_pagamento": pagamento.get("id_pagamento")})
+    logger.debug("Mensagem do pagamento", extra={"mensagem": pagamento})
     status_pagamento = random.choice(["Pago", "Cancelado"])
     logger.info(f"📌 Resultado da simulação: {status_pagamento}")
     return status_pagamento
 
+def _processar_mensagem(mensagem):
+    """Executa processar_pagamento em uma thread, isolando a falha da mensagem (retorna None)."""
+    try:
+        return processar_pagamento(mensagem)
+    except Exception as e:
+        logger.error(f"❌ Erro ao processar o pagamento {mensagem.get('id_pagamento')}: {e}")
+        return None
+
 @tracer.capture_method
-def atualizar_status_pagamento(conn, id_pagamento, status_pagamento):
-    """Atualiza o status do pagamento no banco de dados."""
+def atualizar_status_pagamentos(conn, ids_por_status):
+    """Atualiza o status de todos os pagamentos do lote com um único UPDATE ({status: [ids]})."""
+    casos = []
+    parametros = []
+    todos_ids = []
+    for status_pagamento, ids in ids_por_status.items():
+        if ids:
+            casos.append(f"WHEN id_pagamento IN ({', '.join(['%s'] * len(ids))}) THEN %s")
+            parametros.extend(ids)
+            parametros.append(status_pagamento)
+            todos_ids.extend(ids)
+
+    if not todos_ids:
+        return
+
     try:
         with conn.cursor() as cursor:
-            sql = """
+            sql = f"""
             UPDATE Pagamentos
-            SET status_pagamento = %s
-            WHERE id_pagamento = %s
+            SET status_pagamento = CASE {" ".join(casos)} END
+            WHERE id_pagamento IN ({", ".join(["%s"] * len(todos_ids))})
             """
-            cursor.execute(sql, (status_pagamento, id_pagamento))
-            conn.commit()
-            logger.info(f"✅ Status atualizado para '{status_pagamento}' no pagamento {id_pagamento}")
+            cursor.execute(sql, parametros + todos_ids)
+            logger.info(f"✅ Status atualizado em {len(todos_ids)} pagamento(s)")
     except Exception as e:
-        logger.error(f"❌ Erro ao atualizar status do pagamento: {e}")
+        logger.error(f"❌ Erro ao atualizar status dos pagamentos: {e}")
         raise
 
 @tracer.capture_lambda_handler
@@ -70,61 +161,72 @@ def atualizar_status_pagamento(conn, id_pagamento, status_pagamento):
 @metrics.log_metrics
 def lambda_handler(event, context):
     """Função Lambda para processar pagamentos recebidos do SQS."""
+    global _CONN
     try:
-        logger.info("📌 Evento recebido", extra={"event": event})
+        # Lote completo não é serializado no log; nível controlado por POWERTOOLS_LOG_LEVEL
+        logger.debug("📌 Evento recebido", extra={"records": len(event.get("Records") or [])})
 
         # Obtém credenciais do banco
         creds = get_db_credentials()
         if not creds:
-            return cors_response(500, {"error": "Falha ao obter credenciais do banco"})
+            raise RuntimeError("Falha ao obter credenciais do banco")
 
-        # Conectando ao banco via RDS Proxy
-        try:
-            conn = pymysql.connect(
-                host=creds["host"],
-                user=creds["user"],
-                password=creds["password"],
-                database=creds["database"],
-                connect_timeout=10,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            logger.info("✅ Conexão com o banco bem-sucedida!")
-        except Exception as e:
-            logger.error(f"❌ Erro ao conectar ao banco: {e}")
-            return cors_response(500, {"error": "Falha ao conectar ao banco"})
+        # Reaproveita a conexão com o banco via RDS Proxy (falha cai no except abaixo e é propagada)
+        conn = _get_conn(creds)
 
         # Processar mensagens recebidas via trigger do SQS
         if "Records" not in event:
             logger.info("📭 Nenhuma mensagem recebida via SQS.")
             return cors_response(200, {"message": "Nenhuma solicitação de pagamento encontrada."})
 
+        mensagens = []
         for record in event["Records"]:
             try:
                 # Decodifica a mensagem corretamente
                 mensagem = json.loads(record["body"])
-                logger.info(f"🔄 Processando pagamento ID: {mensagem['id_pagamento']}")
+                id_pagamento = mensagem["id_pagamento"]
 
-                # Simular a integração com PayPal
-                status_pagamento = processar_pagamento(mensagem)
+                # Um id inválido faria o UPDATE do lote inteiro falhar: descarta só esta mensagem
+                if not isinstance(id_pagamento, int) or isinstance(id_pagamento, bool):
+                    logger.error("❌ Mensagem do SQS com id_pagamento inválido descartada", extra={"id_pagamento": repr(id_pagamento)})
+                    continue
 
-                # Atualizar o status do pagamento no banco
-                atualizar_status_pagamento(conn, mensagem["id_pagamento"], status_pagamento)
-
-                # ✅ Enviar métricas para CloudWatch
-                metrics.add_metric(name="UpdateNoBanco", unit=MetricUnit.Count, value=1)
-                if status_pagamento == "Pago":
-                    metrics.add_metric(name="PagamentosConcluidos", unit=MetricUnit.Count, value=1)
-                elif status_pagamento == "Cancelado":
-                    metrics.add_metric(name="PagamentosCancelados", unit=MetricUnit.Count, value=1)
+                logger.info(f"🔄 Processando pagamento ID: {id_pagamento}")
+                mensagens.append(mensagem)
 
             except Exception as e:
                 logger.error(f"❌ Erro ao processar a mensagem do SQS: {e}")
 
-        return cors_response(200, {"message": "Pagamentos processados com sucesso."})
+        # Simular a integração com PayPal, com as mensagens do lote em paralelo
+        ids_por_status = {"Pago": [], "Cancelado": []}
+        for mensagem, status_pagamento in zip(mensagens, _EXECUTOR.map(_processar_mensagem, mensagens)):
+            if status_pagamento:
+                ids_por_status[status_pagamento].append(mensagem["id_pagamento"])
 
     except Exception as e:
         logger.error(f"❌ Erro inesperado: {e}")
-        return cors_response(500, {"error": str(e)})
+        raise  # Propaga para o SQS reentregar o lote em vez de descartá-lo
+
+    # Atualiza o status de todo o lote no banco em um único round-trip.
+    # Uma falha é propagada para o SQS reentregar o lote inteiro (repetir o UPDATE é seguro).
+    try:
+        atualizar_status_pagamentos(conn, ids_por_status)
+    except pymysql.err.OperationalError as e:
+        logger.error(f"❌ Conexão com o banco perdida ao atualizar o lote do SQS: {e}")
+        _CONN = None  # Próxima invocação reconecta
+        raise
+
+    # ✅ Enviar métricas para CloudWatch
+    pagos = len(ids_por_status["Pago"])
+    cancelados = len(ids_por_status["Cancelado"])
+    if pagos or cancelados:
+        metrics.add_metric(name="UpdateNoBanco", unit=MetricUnit.Count, value=pagos + cancelados)
+    if pagos:
+        metrics.add_metric(name="PagamentosConcluidos", unit=MetricUnit.Count, value=pagos)
+    if cancelados:
+        metrics.add_metric(name="PagamentosCancelados", unit=MetricUnit.Count, value=cancelados)
+
+    return cors_response(200, {"message": "Pagamentos processados com sucesso."})
 
 def cors_response(status_code, body):
     """
@@ -132,10 +234,13 @@ def cors_response(status_code, body):
     """
     return {
         "statusCode": status_code,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "OPTIONS, GET, POST",
-            "Access-Control-Allow-Headers": "Content-Type",
-        },
+        "headers": CORS_HEADERS,
         "body": json.dumps(body)
     }
+
+# 🔧 Pré-aquece segredo e conexão na fase INIT (PREWARM_DB=0 desativa, ex.: testes locais)
+if os.getenv("PREWARM_DB", "1") == "1":
+    try:
+        _get_conn(get_db_credentials())
+    except Exception as e:
+        logger.warning(f"Pré-aquecimento da conexão falhou; será refeito na primeira invocação: {e}")
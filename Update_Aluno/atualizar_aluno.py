@@ -1,111 +1,181 @@
 import os
 import json
+import base64
+import time
+import itertools
 import pymysql
 import boto3
-
-# Configuração do Secrets Manager
-secrets_client = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"))
+from botocore.config import Config
+from pymysql.constants import CLIENT
+
+# Keep-alive, pool pequeno e retries limitados para os clientes AWS
+BOTO_CONFIG = Config(
+    max_pool_connections=4,
+    retries={"mode": "standard", "max_attempts": 2},
+    tcp_keepalive=True,
+    connect_timeout=1,
+    read_timeout=2,
+)
+
+# Cliente do Secrets Manager, criado no primeiro uso
+_SECRETS_CLIENT = None
+
+def _get_secrets_client():
+    """
+    Cria o cliente do Secrets Manager sob demanda e o reaproveita nas chamadas seguintes.
+    """
+    global _SECRETS_CLIENT
+    if _SECRETS_CLIENT is None:
+        _SECRETS_CLIENT = boto3.client('secretsmanager', region_name=os.getenv("REGION_NAME"), config=BOTO_CONFIG)
+    return _SECRETS_CLIENT
 
 # Variáveis de ambiente configuradas na AWS Lambda
 SECRET_ARN = os.getenv("SECRET_ARN")  # ARN do Secrets Manager
 DB_PROXY = os.getenv("DB_PROXY")  # Endpoint do RDS Proxy
 DB_NAME = os.getenv("DB_NAME")  # Nome do banco de dados
 
+# Cache das credenciais (sobrevive entre invocações no container quente)
+CREDS_TTL = 900  # segundos
+_CREDS_CACHE = {"value": None, "expires_at": 0.0}
+
+# Conexão com o banco reaproveitada entre invocações
+_CONN = None
+
+# Evento, corpo e parâmetros completos só são impressos com LOG_LEVEL=DEBUG
+LOG_DEBUG = os.getenv("LOG_LEVEL", "INFO").upper() == "DEBUG"
+
+# Campos opcionais que podem ser atualizados, na ordem usada no SQL
+CAMPOS_ATUALIZAVEIS = ("nome",)
+
+# UPDATE pré-montado para cada combinação de campos enviados
+SQL_UPDATE_VARIANTES = {
+    campos: "UPDATE Alunos SET " + ", ".join(f"{campo} = %s" for campo in campos) + " WHERE cpf = %s"
+    for n in range(1, len(CAMPOS_ATUALIZAVEIS) + 1)
+    for campos in itertools.combinations(CAMPOS_ATUALIZAVEIS, n)
+}
+
 def get_db_credentials():
     """
-    Busca as credenciais do banco de dados no AWS Secrets Manager.
+    Busca as credenciais do banco de dados no AWS Secrets Manager, reaproveitando o cache enquanto válido.
     """
+    if _CREDS_CACHE["value"] is not None and time.time() < _CREDS_CACHE["expires_at"]:
+        return _CREDS_CACHE["value"]
+
     try:
         print(f"🔍 Buscando credenciais no Secrets Manager ({SECRET_ARN})...")
-        response = secrets_client.get_secret_value(SecretId=SECRET_ARN)
+        response = _get_secrets_client().get_secret_value(SecretId=SECRET_ARN)
         secret = json.loads(response["SecretString"])
 
-        return {
+        creds = {
             "host": DB_PROXY,  # Usar o endpoint do RDS Proxy
             "user": secret["username"],
             "password": secret["password"],
             "database": DB_NAME,
         }
+        _CREDS_CACHE["value"] = creds
+        _CREDS_CACHE["expires_at"] = time.time() + CREDS_TTL
+        return creds
     except Exception as e:
         print(f"❌ Erro ao buscar credenciais do Secrets Manager: {e}")
         return None
 
-def aluno_existe(conn, cpf):
-    """Verifica se o CPF já está cadastrado no banco de dados."""
+def _get_conn(creds):
+    """
+    Retorna a conexão com o RDS Proxy, reaproveitando a do container quente enquanto estiver ativa.
+    """
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.ping(reconnect=True)
+            return _CONN
+        except pymysql.err.Error as e:
+            print(f"⚠️ Conexão reaproveitada indisponível, reconectando: {e}")
+            _CONN = None
+
     try:
-        with conn.cursor() as cursor:
-            sql = "SELECT COUNT(*) FROM Alunos WHERE cpf = %s"
-            cursor.execute(sql, (cpf,))
-            result = cursor.fetchone()
-            return result[0] > 0
-    except Exception as e:
-        print(f"❌ Erro ao verificar aluno: {e}")
-        return False
+        _CONN = pymysql.connect(
+            host=creds["host"],
+            user=creds["user"],
+            password=creds["password"],
+            database=creds["database"],
+            connect_timeout=10,
+            autocommit=True,  # UPDATE de comando único, sem transação aberta entre invocações
+            client_flag=CLIENT.FOUND_ROWS  # rowcount conta linhas encontradas, mesmo sem alteração
+        )
+    except pymysql.err.OperationalError:
+        _CREDS_CACHE["expires_at"] = 0.0  # Força nova leitura do segredo (ex.: senha rotacionada)
+        raise
+    return _CONN
 
 def lambda_handler(event, context):
+    global _CONN
     try:
-        print(f"📌 Evento recebido: {event}")
+        if LOG_DEBUG:
+            print(f"📌 Evento recebido: {event}")
 
         # Verifica se o corpo da requisição está presente
         if "body" not in event:
             return {"statusCode": 400, "body": json.dumps({"error": "Requisição inválida, 'body' ausente"})}
 
-        # Converte JSON para dicionário Python
-        body = json.loads(event["body"]) if isinstance(event["body"], str) else event["body"]
-        print(f"📌 JSON Decodificado: {body}")
+        # Converte JSON para dicionário Python (base64 quando a API tem binary media types)
+        raw_body = event["body"]
+        if event.get("isBase64Encoded"):
+            raw_body = base64.b64decode(raw_body)
+        body = json.loads(raw_body) if isinstance(raw_body, (str, bytes)) else raw_body
+        if LOG_DEBUG:
+            print(f"📌 JSON Decodificado: {body}")
 
         # Verifica se os campos obrigatórios existem
         if "cpf" not in body:
             return {"statusCode": 400, "body": json.dumps({"error": "Campo 'cpf' é obrigatório para atualização"})}
 
         cpf = body["cpf"]
-        nome = body.get("nome")  # Nome pode ser opcional
 
         print(f"✅ Atualizando aluno com CPF={cpf}")
 
+        # Campos enviados (nome pode ser opcional) escolhem o UPDATE pré-montado
+        campos = tuple(campo for campo in CAMPOS_ATUALIZAVEIS if body.get(campo))
+
+        # Sem campos para atualizar, o UPDATE seria inválido
+        if not campos:
+            return {"statusCode": 400, "body": json.dumps({"error": "Nenhum campo para atualizar"})}
+
+        sql = SQL_UPDATE_VARIANTES[campos]
+        parameters = [body[campo] for campo in campos]
+        parameters.append(cpf)
+
         # Obtém credenciais seguras do banco
         creds = get_db_credentials()
         if not creds:
             return {"statusCode": 500, "body": json.dumps({"error": "Falha ao obter credenciais do banco"})}
 
-        # Conectando ao banco via RDS Proxy
-        conn = pymysql.connect(
-            host=creds["host"],
-            user=creds["user"],
-            password=creds["password"],
-            database=creds["database"],
-            connect_timeout=10,
-            cursorclass=pymysql.cursors.DictCursor
-        )
-
-        with conn:
-            # Verifica se o aluno existe antes de tentar atualizar
-            if not aluno_existe(conn, cpf):
-                return {"statusCode": 404, "body": json.dumps({"error": "Aluno não encontrado"})}
-
-            # Construir a query de atualização dinamicamente
-            sql = "UPDATE Alunos SET "
-            parameters = []
-            fields_to_update = []
-
-            if nome:
-                fields_to_update.append("nome = %s")
-                parameters.append(nome)
+        # Reaproveita a conexão com o RDS Proxy
+        conn = _get_conn(creds)
 
-            sql += ", ".join(fields_to_update)
-            sql += " WHERE cpf = %s"
-            parameters.append(cpf)
-
-            print(f"🔄 SQL Query: {sql}")
+        if LOG_DEBUG:
             print(f"📌 Parâmetros: {parameters}")
 
-            # Executa o UPDATE no banco de dados
-            with conn.cursor() as cursor:
-                cursor.execute(sql, parameters)
-                conn.commit()
+        # Executa o UPDATE no banco de dados; nenhuma linha encontrada significa CPF inexistente
+        with conn.cursor() as cursor:
+            cursor.execute(sql, parameters)
+            if cursor.rowcount == 0:
+                return {"statusCode": 404, "body": json.dumps({"error": "Aluno não encontrado"})}
 
         return {"statusCode": 200, "body": json.dumps({"message": "Dados do aluno atualizados com sucesso"})}
 
+    except pymysql.err.OperationalError as e:
+        print(f"❌ Conexão com o banco perdida: {e}")
+        _CONN = None  # Próxima invocação reconecta
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
     except Exception as e:
         print(f"❌ Erro inesperado: {e}")
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+
+# Pré-aquece segredo e conexão na fase INIT (PREWARM_DB=0 desativa, ex.: testes locais)
+if os.getenv("PREWARM_DB", "1") == "1":
+    try:
+        _creds_init = get_db_credentials()
+        if _creds_init:
+            _get_conn(_creds_init)
+    except Exception as e:
+        print(f"⚠️ Pré-aquecimento da conexão falhou; será refeito na primeira invocação: {e}")